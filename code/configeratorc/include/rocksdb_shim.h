@@ -49,12 +49,34 @@ extern "C"
         size_t *value_len,
         char **error);
 
+    int rocksdb_merge(
+        rocksdb_handle *handle,
+        const char *key,
+        size_t key_len,
+        const char *value,
+        size_t value_len,
+        char **error);
+
+    int rocksdb_merge_batch(
+        rocksdb_handle *handle,
+        const char *const *keys,
+        const size_t *key_lens,
+        const char *const *values,
+        const size_t *value_lens,
+        size_t count,
+        int disable_wal,
+        char **error);
+
     int rocksdb_delete(
         rocksdb_handle *handle,
         const char *key,
         size_t key_len,
         char **error);
 
+    int rocksdb_flush(
+        rocksdb_handle *handle,
+        char **error);
+
     void rocksdb_free(void *p);
 
     rocksdb_prefix_iterator *rocksdb_create_prefix_iterator(
@@ -71,6 +93,14 @@ extern "C"
         size_t *key_len,
         char **error);
 
+    int rocksdb_advance_prefix_iterator_batch(
+        rocksdb_prefix_iterator *prefix_iterator,
+        size_t max_keys,
+        const char **key_data,
+        size_t *key_lens,
+        size_t *key_count,
+        char **error);
+
 #ifdef __cplusplus
 }
 #endif
\ No newline at end of file
@@ -0,0 +1,272 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "rocksdb_shim.h"
+
+// Fast paths for the short, hot DB operations. These call straight into the
+// shim with the key/value buffers of the bytes objects, skipping the ctypes
+// argument marshalling that DB.py pays for every other shim call.
+
+static int
+get_handle(PyObject *arg, rocksdb_handle **handle)
+{
+    if (arg == Py_None)
+    {
+        *handle = NULL;
+        return 0;
+    }
+
+    void *p = PyLong_AsVoidPtr(arg);
+    if (p == NULL && PyErr_Occurred())
+    {
+        return -1;
+    }
+
+    *handle = (rocksdb_handle *)p;
+    return 0;
+}
+
+static PyObject *
+error_to_str(char *error)
+{
+    if (!error)
+    {
+        return PyUnicode_FromString("None");
+    }
+
+    PyObject *message = PyUnicode_DecodeUTF8(error, strlen(error), "replace");
+    rocksdb_free(error);
+    return message;
+}
+
+static PyObject *
+ext_put(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    rocksdb_handle *handle;
+    char *key;
+    Py_ssize_t key_len;
+    char *value;
+    Py_ssize_t value_len;
+    char *error = NULL;
+    int result;
+
+    if (nargs != 3)
+    {
+        PyErr_Format(
+            PyExc_TypeError,
+            "put() takes exactly 3 arguments (%zd given)",
+            nargs);
+        return NULL;
+    }
+
+    if (get_handle(args[0], &handle) < 0 ||
+        PyBytes_AsStringAndSize(args[1], &key, &key_len) < 0 ||
+        PyBytes_AsStringAndSize(args[2], &value, &value_len) < 0)
+    {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    result = rocksdb_put(handle, key, key_len, value, value_len, &error);
+    Py_END_ALLOW_THREADS
+
+    if (result < 0)
+    {
+        PyObject *message = error_to_str(error);
+        if (message)
+        {
+            PyErr_Format(
+                PyExc_RuntimeError,
+                "Failed to put key-value pair %R=%R: %U",
+                args[1],
+                args[2],
+                message);
+            Py_DECREF(message);
+        }
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+ext_merge(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    rocksdb_handle *handle;
+    char *key;
+    Py_ssize_t key_len;
+    char *value;
+    Py_ssize_t value_len;
+    char *error = NULL;
+    int result;
+
+    if (nargs != 3)
+    {
+        PyErr_Format(
+            PyExc_TypeError,
+            "merge() takes exactly 3 arguments (%zd given)",
+            nargs);
+        return NULL;
+    }
+
+    if (get_handle(args[0], &handle) < 0 ||
+        PyBytes_AsStringAndSize(args[1], &key, &key_len) < 0 ||
+        PyBytes_AsStringAndSize(args[2], &value, &value_len) < 0)
+    {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    result = rocksdb_merge(handle, key, key_len, value, value_len, &error);
+    Py_END_ALLOW_THREADS
+
+    if (result < 0)
+    {
+        PyObject *message = error_to_str(error);
+        if (message)
+        {
+            PyErr_Format(
+                PyExc_RuntimeError,
+                "Failed to merge value %R into key %R: %U",
+                args[2],
+                args[1],
+                message);
+            Py_DECREF(message);
+        }
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+ext_get(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    rocksdb_handle *handle;
+    char *key;
+    Py_ssize_t key_len;
+    char *value = NULL;
+    size_t value_len = 0;
+    char *error = NULL;
+    int result;
+
+    if (nargs != 2)
+    {
+        PyErr_Format(
+            PyExc_TypeError,
+            "get() takes exactly 2 arguments (%zd given)",
+            nargs);
+        return NULL;
+    }
+
+    if (get_handle(args[0], &handle) < 0 ||
+        PyBytes_AsStringAndSize(args[1], &key, &key_len) < 0)
+    {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    result = rocksdb_get(handle, key, key_len, &value, &value_len, &error);
+    Py_END_ALLOW_THREADS
+
+    if (result == 1)
+    {
+        Py_RETURN_NONE;
+    }
+
+    if (result < 0)
+    {
+        PyObject *message = error_to_str(error);
+        if (message)
+        {
+            PyErr_Format(
+                PyExc_RuntimeError,
+                "Failed to get value for key %R: %U",
+                args[1],
+                message);
+            Py_DECREF(message);
+        }
+        return NULL;
+    }
+
+    if (!value)
+    {
+        return PyBytes_FromStringAndSize(NULL, 0);
+    }
+
+    PyObject *data = PyBytes_FromStringAndSize(value, (Py_ssize_t)value_len);
+    rocksdb_free(value);
+    return data;
+}
+
+static PyObject *
+ext_delete(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    rocksdb_handle *handle;
+    char *key;
+    Py_ssize_t key_len;
+    char *error = NULL;
+    int result;
+
+    if (nargs != 2)
+    {
+        PyErr_Format(
+            PyExc_TypeError,
+            "delete() takes exactly 2 arguments (%zd given)",
+            nargs);
+        return NULL;
+    }
+
+    if (get_handle(args[0], &handle) < 0 ||
+        PyBytes_AsStringAndSize(args[1], &key, &key_len) < 0)
+    {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    result = rocksdb_delete(handle, key, key_len, &error);
+    Py_END_ALLOW_THREADS
+
+    if (result < 0)
+    {
+        PyObject *message = error_to_str(error);
+        if (message)
+        {
+            PyErr_Format(
+                PyExc_RuntimeError,
+                "Failed to delete key %R: %U",
+                args[1],
+                message);
+            Py_DECREF(message);
+        }
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef ext_methods[] = {
+    {"put", (PyCFunction)(void (*)(void))ext_put, METH_FASTCALL,
+     "put(handle, key, value)\n--\n\nStore value under key."},
+    {"merge", (PyCFunction)(void (*)(void))ext_merge, METH_FASTCALL,
+     "merge(handle, key, value)\n--\n\nMerge value into key."},
+    {"get", (PyCFunction)(void (*)(void))ext_get, METH_FASTCALL,
+     "get(handle, key)\n--\n\nReturn the value stored under key, or None."},
+    {"delete", (PyCFunction)(void (*)(void))ext_delete, METH_FASTCALL,
+     "delete(handle, key)\n--\n\nDelete key."},
+    {NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef ext_module = {
+    PyModuleDef_HEAD_INIT,
+    .m_name = "_rocksdb_ext",
+    .m_doc = "Fast paths for hot RocksDB shim calls.",
+    .m_size = 0,
+    .m_methods = ext_methods,
+};
+
+PyMODINIT_FUNC
+PyInit__rocksdb_ext(void)
+{
+    return PyModule_Create(&ext_module);
+}
@@ -1,29 +1,72 @@
-from collections.abc import Iterator
-from pathlib import PurePosixPath
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from pathlib import PosixPath, PurePosixPath
 from .DB import DB
 
 
-def _get_rdeps_key(child_path: PurePosixPath, parent_path: PurePosixPath) -> bytes:
-    return f"rdeps\0{child_path}\0{parent_path}".encode("utf-8")
+@lru_cache(maxsize=4096)
+def _get_rdeps_key(child_path: PurePosixPath) -> bytes:
+    return b"rdeps\0" + str(child_path).encode("utf-8")
 
 
-def _get_rdeps_search_key(child_path: PurePosixPath) -> bytes:
-    return f"rdeps\0{child_path}\0".encode("utf-8")
+_SCHEMA_VERSION_KEY = b"schema_version"
+_SCHEMA_VERSION = b"2"
 
 
 class ConfigStore:
     _db: DB
 
     def __init__(self, db: DB):
+        version = db.get(_SCHEMA_VERSION_KEY)
+        if version != _SCHEMA_VERSION:
+            raise RuntimeError(
+                "Config database has schema version "
+                f"{version.decode('utf-8') if version else 'unknown'}, "
+                f"expected {_SCHEMA_VERSION.decode('utf-8')}; "
+                "remove it, run 'db create' and rebuild all configs"
+            )
         self._db = db
 
+    @classmethod
+    def create(cls, db_dir: PosixPath) -> None:
+        with DB.open("rw", db_dir) as db:
+            version = db.get(_SCHEMA_VERSION_KEY)
+            if version is None:
+                keys = db.get_keys_by_prefix(b"rdeps\0")
+                try:
+                    has_rdeps = next(keys, None) is not None
+                finally:
+                    keys.close()
+                if has_rdeps:
+                    raise RuntimeError(
+                        f"Config database at {db_dir} predates schema "
+                        "versioning; remove it and create it again"
+                    )
+                db.put(_SCHEMA_VERSION_KEY, _SCHEMA_VERSION)
+            cls(db)
+
     def put_rdep(
         self, child_path: PurePosixPath, parent_path: PurePosixPath
     ) -> PurePosixPath:
-        self._db.put(_get_rdeps_key(child_path, parent_path), b"")
+        self._db.merge(_get_rdeps_key(child_path), str(parent_path).encode("utf-8"))
         return child_path
 
+    def put_rdeps(
+        self,
+        child_paths: Iterable[PurePosixPath],
+        parent_path: PurePosixPath,
+        *,
+        disable_wal: bool = False,
+    ) -> None:
+        parent = str(parent_path).encode("utf-8")
+        self._db.merge_batch(
+            ((_get_rdeps_key(child_path), parent) for child_path in child_paths),
+            disable_wal=disable_wal,
+        )
+
     def get_rdeps(self, child_path: PurePosixPath) -> Iterator[PurePosixPath]:
-        search_key = _get_rdeps_search_key(child_path)
-        for key in self._db.get_keys_by_prefix(search_key):
-            yield PurePosixPath(key[len(search_key) :].decode("utf-8"))
+        parent_paths = self._db.get(_get_rdeps_key(child_path))
+        if not parent_paths:
+            return
+        for parent_path in parent_paths.split(b"\0"):
+            yield PurePosixPath(parent_path.decode("utf-8"))
@@ -2,15 +2,37 @@ from contextlib import contextmanager
 import ctypes
 import logging
 from pathlib import PosixPath
+import shutil
+import subprocess
 from tempfile import TemporaryDirectory
-from typing import Iterator, Literal, Optional
+from typing import Callable, Iterable, Iterator, Literal, Optional
 import tarfile
 
 _lib: Optional[ctypes.CDLL] = None
 
+_rocksdb_close: Callable[..., None]
+_rocksdb_merge_batch: Callable[..., int]
+_rocksdb_free: Callable[..., None]
+_rocksdb_create_prefix_iterator: Callable[..., Optional[int]]
+_rocksdb_destroy_prefix_iterator: Callable[..., None]
+_rocksdb_advance_prefix_iterator_batch: Callable[..., int]
+
+_ext_put: Callable[[Optional[int], bytes, bytes], None]
+_ext_merge: Callable[[Optional[int], bytes, bytes], None]
+_ext_get: Callable[[Optional[int], bytes], Optional[bytes]]
+_ext_delete: Callable[[Optional[int], bytes], None]
+
+_KEY_BATCH_SIZE = 256
+
 
 def _load_lib() -> ctypes.CDLL:
     global _lib
+    global _rocksdb_close, _rocksdb_merge_batch
+    global _rocksdb_free
+    global _rocksdb_create_prefix_iterator, _rocksdb_destroy_prefix_iterator
+    global _rocksdb_advance_prefix_iterator_batch
+    global _ext_put, _ext_merge, _ext_get, _ext_delete
+
     if _lib is not None:
         return _lib
 
@@ -35,52 +57,35 @@ def _load_lib() -> ctypes.CDLL:
     lib.rocksdb_close.argtypes = [ctypes.c_void_p]
     lib.rocksdb_close.restype = None
 
-    # int rocksdb_put(
+    # int rocksdb_merge_batch(
     #     rocksdb_handle *handle,
-    #     const char *key,
-    #     size_t key_len,
-    #     const char *value,
-    #     size_t value_len,
+    #     const char *const *keys,
+    #     const size_t *key_lens,
+    #     const char *const *values,
+    #     const size_t *value_lens,
+    #     size_t count,
+    #     int disable_wal,
     #     char **error);
-    lib.rocksdb_put.argtypes = [
+    lib.rocksdb_merge_batch.argtypes = [
         ctypes.c_void_p,
-        ctypes.c_char_p,
-        ctypes.c_size_t,
-        ctypes.c_char_p,
-        ctypes.c_size_t,
         ctypes.POINTER(ctypes.c_char_p),
-    ]
-    lib.rocksdb_put.restype = ctypes.c_int
-
-    # int rocksdb_get(
-    #     rocksdb_handle *handle,
-    #     const char *key,
-    #     size_t key_len,
-    #     char **value,
-    #     size_t *value_len,
-    #     char **error);
-    lib.rocksdb_get.argtypes = [
-        ctypes.c_void_p,
-        ctypes.c_char_p,
-        ctypes.c_size_t,
+        ctypes.POINTER(ctypes.c_size_t),
         ctypes.POINTER(ctypes.c_char_p),
         ctypes.POINTER(ctypes.c_size_t),
+        ctypes.c_size_t,
+        ctypes.c_int,
         ctypes.POINTER(ctypes.c_char_p),
     ]
-    lib.rocksdb_get.restype = ctypes.c_int
+    lib.rocksdb_merge_batch.restype = ctypes.c_int
 
-    # int rocksdb_delete(
+    # int rocksdb_flush(
     #     rocksdb_handle *handle,
-    #     const char *key,
-    #     size_t key_len,
     #     char **error);
-    lib.rocksdb_delete.argtypes = [
+    lib.rocksdb_flush.argtypes = [
         ctypes.c_void_p,
-        ctypes.c_char_p,
-        ctypes.c_size_t,
         ctypes.POINTER(ctypes.c_char_p),
     ]
-    lib.rocksdb_delete.restype = ctypes.c_int
+    lib.rocksdb_flush.restype = ctypes.c_int
 
     # void rocksdb_free(void *p);
     lib.rocksdb_free.argtypes = [ctypes.c_void_p]
@@ -103,18 +108,24 @@ def _load_lib() -> ctypes.CDLL:
     lib.rocksdb_destroy_prefix_iterator.argtypes = [ctypes.c_void_p]
     lib.rocksdb_destroy_prefix_iterator.restype = None
 
-    # int rocksdb_advance_prefix_iterator(
+    # int rocksdb_advance_prefix_iterator_batch(
     #     rocksdb_prefix_iterator *prefix_iterator,
+    #     size_t max_keys,
     #     const char **key_data,
-    #     size_t *key_len,
+    #     size_t *key_lens,
+    #     size_t *key_count,
     #     char **error);
-    lib.rocksdb_advance_prefix_iterator.argtypes = [
+    # key_data is c_void_p rather than c_char_p so that ctypes hands back raw
+    # addresses instead of copying every key up to its first NUL.
+    lib.rocksdb_advance_prefix_iterator_batch.argtypes = [
         ctypes.c_void_p,
-        ctypes.POINTER(ctypes.c_char_p),
+        ctypes.c_size_t,
+        ctypes.POINTER(ctypes.c_void_p),
+        ctypes.POINTER(ctypes.c_size_t),
         ctypes.POINTER(ctypes.c_size_t),
         ctypes.POINTER(ctypes.c_char_p),
     ]
-    lib.rocksdb_advance_prefix_iterator.restype = ctypes.c_int
+    lib.rocksdb_advance_prefix_iterator_batch.restype = ctypes.c_int
 
     # rocksdb_handle *rocksdb_open_read_only(
     #     const char *path,
@@ -149,16 +160,31 @@ def _load_lib() -> ctypes.CDLL:
     ]
     lib.rocksdb_restore_latest_backup.restype = ctypes.c_int
 
+    _rocksdb_close = lib.rocksdb_close
+    _rocksdb_merge_batch = lib.rocksdb_merge_batch
+    _rocksdb_free = lib.rocksdb_free
+    _rocksdb_create_prefix_iterator = lib.rocksdb_create_prefix_iterator
+    _rocksdb_destroy_prefix_iterator = lib.rocksdb_destroy_prefix_iterator
+    _rocksdb_advance_prefix_iterator_batch = (
+        lib.rocksdb_advance_prefix_iterator_batch
+    )
+
+    from . import _rocksdb_ext
+
+    _ext_put = _rocksdb_ext.put
+    _ext_merge = _rocksdb_ext.merge
+    _ext_get = _rocksdb_ext.get
+    _ext_delete = _rocksdb_ext.delete
+
     _lib = lib
     return lib
 
 
 def _get_error(error: ctypes.c_char_p) -> str | None:
-    lib = _load_lib()
     if not error:
         return None
     value = error.value
-    lib.rocksdb_free(error)
+    _rocksdb_free(error)
     if not value:
         return None
     return value.decode("utf-8")
@@ -167,10 +193,59 @@ def _get_error(error: ctypes.c_char_p) -> str | None:
 logger = logging.getLogger(__name__)
 
 
+def _write_snapshot(snapshot_file: PosixPath, source_dir: PosixPath) -> None:
+    pigz = shutil.which("pigz")
+    if pigz is None:
+        with tarfile.open(snapshot_file, "w:gz") as tar:
+            tar.add(source_dir, arcname=".")
+        return
+
+    with snapshot_file.open("wb") as out:
+        proc = subprocess.Popen([pigz, "-c"], stdin=subprocess.PIPE, stdout=out)
+        assert proc.stdin is not None
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                tar.add(source_dir, arcname=".")
+        finally:
+            proc.stdin.close()
+            returncode = proc.wait()
+
+    if returncode != 0:
+        raise RuntimeError(
+            f"Failed to write snapshot file {snapshot_file}: "
+            f"pigz exited with status {returncode}"
+        )
+
+
+def _extract_snapshot(snapshot_file: PosixPath, dest_dir: PosixPath) -> None:
+    pigz = shutil.which("pigz")
+    if pigz is None:
+        with tarfile.open(snapshot_file, "r:gz") as tar:
+            tar.extractall(path=dest_dir, filter="data")
+        return
+
+    proc = subprocess.Popen(
+        [pigz, "-d", "-c", str(snapshot_file)], stdout=subprocess.PIPE
+    )
+    assert proc.stdout is not None
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+            tar.extractall(path=dest_dir, filter="data")
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+
+    if returncode != 0:
+        raise RuntimeError(
+            f"Failed to read snapshot file {snapshot_file}: "
+            f"pigz exited with status {returncode}"
+        )
+
+
 class DB:
-    _handle: ctypes.c_void_p
+    _handle: Optional[int]
 
-    def __init__(self, handle: ctypes.c_void_p) -> None:
+    def __init__(self, handle: Optional[int]) -> None:
         self._handle = handle
 
     def __del__(self) -> None:
@@ -180,9 +255,8 @@ class DB:
     def close(self) -> None:
         logger.debug("Closing database connection")
         if self._handle:
-            lib = _load_lib()
-            lib.rocksdb_close(self._handle)
-        self._handle = ctypes.c_void_p()
+            _rocksdb_close(self._handle)
+        self._handle = None
 
     @classmethod
     def create(cls, db_dir: PosixPath) -> None:
@@ -202,8 +276,7 @@ class DB:
                 snapshot_file,
                 backup_dir,
             )
-            with tarfile.open(snapshot_file, "r:gz") as tar:
-                tar.extractall(path=backup_dir)
+            _extract_snapshot(snapshot_file, backup_dir)
 
             logger.debug(
                 "Restoring database into %s",
@@ -248,8 +321,7 @@ class DB:
                 snapshot_file,
             )
 
-            with tarfile.open(snapshot_file, "w:gz") as tar:
-                tar.add(backup_dir, arcname=".")
+            _write_snapshot(snapshot_file, backup_dir)
 
     @classmethod
     @contextmanager
@@ -260,28 +332,16 @@ class DB:
         logger.debug("Opening database at %s (mode=%s)", db_dir, mode)
 
         if mode == "r":
-            try:
-                handle = lib.rocksdb_open_read_only(
-                    str(db_dir).encode("utf-8"),
-                    ctypes.byref(error),
-                )
-                yield cls(handle)
-            except Exception as e:
-                raise RuntimeError(
-                    f"Failed to open RocksDB at {db_dir}: {_get_error(error)}"
-                ) from e
+            handle = lib.rocksdb_open_read_only(
+                str(db_dir).encode("utf-8"),
+                ctypes.byref(error),
+            )
         elif mode == "rw":
-            try:
-                handle = lib.rocksdb_open(
-                    str(db_dir).encode("utf-8"),
-                    1,
-                    ctypes.byref(error),
-                )
-                yield cls(handle)
-            except Exception as e:
-                raise RuntimeError(
-                    f"Failed to open RocksDB at {db_dir}: {_get_error(error)}"
-                ) from e
+            handle = lib.rocksdb_open(
+                str(db_dir).encode("utf-8"),
+                1,
+                ctypes.byref(error),
+            )
         else:
             raise ValueError(f"Invalid mode: {mode}")
 
@@ -290,86 +350,90 @@ class DB:
                 f"Failed to open RocksDB at {db_dir}: {_get_error(error)}"
             )
 
-    def get(self, key: bytes) -> Optional[bytes]:
-        lib = _load_lib()
-        value_ptr = ctypes.c_char_p()
-        value_len = ctypes.c_size_t()
-        error = ctypes.c_char_p()
-
-        result = lib.rocksdb_get(
-            self._handle,
-            key,
-            len(key),
-            ctypes.byref(value_ptr),
-            ctypes.byref(value_len),
-            ctypes.byref(error),
-        )
-
-        if result == 1:
-            return None
-
-        if result < 0:
-            raise RuntimeError(
-                f"Failed to get value for key {key!r}: {_get_error(error)}"
-            )
-
-        if not value_ptr:
-            return b""
-
+        db = cls(handle)
         try:
-            data = ctypes.string_at(value_ptr, value_len.value)
+            yield db
         finally:
-            lib.rocksdb_free(ctypes.cast(value_ptr, ctypes.c_void_p))
+            db.close()
 
-        return data
+    def get(self, key: bytes) -> Optional[bytes]:
+        return _ext_get(self._handle, key)
 
     def get_keys_by_prefix(self, prefix: bytes) -> DB.KeyIterator:
         return DB.KeyIterator(self._handle, prefix)
 
     def put(self, key: bytes, value: bytes) -> None:
-        lib = _load_lib()
+        _ext_put(self._handle, key, value)
+
+    def merge(self, key: bytes, value: bytes) -> None:
+        _ext_merge(self._handle, key, value)
+
+    # Batches written with disable_wal=True are lost on a crash until flush()
+    # or a clean close, so callers must be able to redo the whole batch.
+    def merge_batch(
+        self, items: Iterable[tuple[bytes, bytes]], *, disable_wal: bool = False
+    ) -> None:
+        pairs = list(items)
+        if not pairs:
+            return
+
         error = ctypes.c_char_p()
 
-        result = lib.rocksdb_put(
+        count = len(pairs)
+        keys, values = zip(*pairs)
+
+        result = _rocksdb_merge_batch(
             self._handle,
-            key,
-            len(key),
-            value,
-            len(value),
+            (ctypes.c_char_p * count)(*keys),
+            (ctypes.c_size_t * count)(*map(len, keys)),
+            (ctypes.c_char_p * count)(*values),
+            (ctypes.c_size_t * count)(*map(len, values)),
+            count,
+            1 if disable_wal else 0,
             ctypes.byref(error),
         )
 
         if result < 0:
             raise RuntimeError(
-                f"Failed to put key-value pair {key!r}={value!r}: "
+                f"Failed to merge batch of {count} key-value pairs: "
                 f"{_get_error(error)}"
             )
 
-    def delete(self, key: bytes) -> None:
+    def flush(self) -> None:
         lib = _load_lib()
         error = ctypes.c_char_p()
 
-        result = lib.rocksdb_delete(
-            self._handle,
-            key,
-            len(key),
-            ctypes.byref(error),
-        )
+        result = lib.rocksdb_flush(self._handle, ctypes.byref(error))
 
-        if result < 0:
-            raise RuntimeError(f"Failed to delete key {key!r}: {_get_error(error)}")
+        if result != 0:
+            raise RuntimeError(f"Failed to flush database: {_get_error(error)}")
+
+    def delete(self, key: bytes) -> None:
+        _ext_delete(self._handle, key)
 
     class KeyIterator:
-        _lib: ctypes.CDLL
         _iter: Optional[ctypes.c_void_p]
-
-        def __init__(self, handle: ctypes.c_void_p, prefix: bytes):
-            lib = _load_lib()
-            self._lib = lib
+        _key_data: ctypes.Array[ctypes.c_void_p]
+        _key_lens: ctypes.Array[ctypes.c_size_t]
+        _key_count: ctypes.c_size_t
+        _error: ctypes.c_char_p
+        _advance_args: tuple[object, ...]
+        _count: int
+        _index: int
+
+        def __init__(self, handle: Optional[int], prefix: bytes):
             self._iter = None
 
+            self._key_data = (ctypes.c_void_p * _KEY_BATCH_SIZE)()
+            self._key_lens = (ctypes.c_size_t * _KEY_BATCH_SIZE)()
+            self._key_count = ctypes.c_size_t()
+            self._error = ctypes.c_char_p()
+            self._advance_args = ()
+            self._count = 0
+            self._index = 0
+
             error = ctypes.c_char_p()
-            it = lib.rocksdb_create_prefix_iterator(
+            it = _rocksdb_create_prefix_iterator(
                 handle,
                 prefix,
                 len(prefix),
@@ -381,6 +445,14 @@ class DB:
                 )
 
             self._iter = it
+            self._advance_args = (
+                it,
+                _KEY_BATCH_SIZE,
+                self._key_data,
+                self._key_lens,
+                ctypes.byref(self._key_count),
+                ctypes.byref(self._error),
+            )
 
         def __del__(self):
             try:
@@ -389,27 +461,30 @@ class DB:
                 pass
 
         def close(self) -> None:
+            self._count = 0
+            self._index = 0
             if self._iter:
-                self._lib.rocksdb_destroy_prefix_iterator(self._iter)
+                _rocksdb_destroy_prefix_iterator(self._iter)
                 self._iter = None
+                self._advance_args = ()
 
         def __iter__(self) -> DB.KeyIterator:
             return self
 
         def __next__(self) -> bytes:
+            index = self._index
+            if index == self._count:
+                self._advance()
+                index = 0
+
+            self._index = index + 1
+            return ctypes.string_at(self._key_data[index], self._key_lens[index])
+
+        def _advance(self) -> None:
             if not self._iter:
                 raise StopIteration
 
-            key_ptr = ctypes.c_char_p()
-            key_len = ctypes.c_size_t()
-            error = ctypes.c_char_p()
-
-            rc = self._lib.rocksdb_advance_prefix_iterator(
-                self._iter,
-                ctypes.byref(key_ptr),
-                ctypes.byref(key_len),
-                ctypes.byref(error),
-            )
+            rc = _rocksdb_advance_prefix_iterator_batch(*self._advance_args)
 
             if rc == 1:
                 self.close()
@@ -418,7 +493,8 @@ class DB:
             if rc < 0:
                 self.close()
                 raise RuntimeError(
-                    f"Failed to advance key iterator: {_get_error(error)}"
+                    f"Failed to advance key iterator: {_get_error(self._error)}"
                 )
 
-            return ctypes.string_at(key_ptr, key_len.value)
+            self._count = self._key_count.value
+            self._index = 0
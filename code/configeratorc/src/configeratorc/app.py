@@ -1,30 +1,35 @@
 import argparse
 import logging
+import os
 import sys
-from pathlib import PosixPath
-from types import MappingProxyType
 from typing import Final
-from .DB import DB
-from .build import build
 
-_LOG_LEVELS = {
-    "DEBUG": logging.DEBUG,
-    "INFO": logging.INFO,
-    "WARNING": logging.WARNING,
-    "ERROR": logging.ERROR,
-}
+# Must be set before google.protobuf is first imported.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
 
-LOG_LEVELS: Final = MappingProxyType(_LOG_LEVELS)
+from .paths import get_cwd, resolve_path
 
+LOG_LEVELS: Final = logging.getLevelNamesMapping()
 
-def main(argv: list[str] | None = None) -> int:
+
+_parser: argparse.ArgumentParser | None = None
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    global _parser
+    if _parser is None:
+        _parser = _build_parser()
+    return _parser
+
+
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="configeratorc")
 
     parser.add_argument(
         "--log-level",
         dest="log_level",
         type=str.upper,
-        choices=LOG_LEVELS.keys(),
+        choices=("DEBUG", "INFO", "WARNING", "ERROR"),
         default="INFO",
     )
 
@@ -45,6 +50,8 @@ def main(argv: list[str] | None = None) -> int:
         help="create a new config database",
     )
 
+    create.set_defaults(func=create_command)
+
     create.add_argument(
         "db_dir",
         metavar="DB_DIR",
@@ -57,6 +64,8 @@ def main(argv: list[str] | None = None) -> int:
         help="restore a config database from a snapshot",
     )
 
+    restore.set_defaults(func=restore_command)
+
     restore.add_argument(
         "snapshot_file",
         metavar="SNAPSHOT_FILE",
@@ -76,6 +85,8 @@ def main(argv: list[str] | None = None) -> int:
         help="save a snapshot of a config database",
     )
 
+    backup.set_defaults(func=backup_command)
+
     backup.add_argument(
         "db_dir",
         metavar="DB_DIR",
@@ -90,12 +101,15 @@ def main(argv: list[str] | None = None) -> int:
         help="the path the snapshot file will be written to",
     )
 
-    build = subparsers.add_parser("build", help="build a config file")
+    build = subparsers.add_parser("build", help="build one or more config files")
+
+    build.set_defaults(func=build_command)
 
     build.add_argument(
-        "config_file",
+        "config_files",
         type=str,
-        help="path of the config file to build",
+        nargs="+",
+        help="paths of the config files to build",
         metavar="CONFIG_FILE",
     )
 
@@ -115,7 +129,89 @@ def main(argv: list[str] | None = None) -> int:
         metavar="DB_DIR",
     )
 
-    build.add_argument("--json", action="store_true", help="output config as JSON")
+    build.add_argument(
+        "--json",
+        action="store_true",
+        help="output config as JSON (deprecated: build binary output and use pb2json)",
+    )
+
+    build_all = subparsers.add_parser(
+        "build-all", help="build every config file matching a glob in parallel"
+    )
+
+    build_all.set_defaults(func=build_all_command)
+
+    build_all.add_argument(
+        "pattern",
+        type=str,
+        help="glob of the config files to build, e.g. 'configs/**/*.py'",
+        metavar="PATTERN",
+    )
+
+    build_all.add_argument(
+        "out_dir",
+        type=str,
+        help="path of the directory to write output to",
+        metavar="OUT_DIR",
+    )
+
+    build_all.add_argument(
+        "--db",
+        dest="db_dir",
+        type=str,
+        help="path of the directory containing the config database to use",
+        required=True,
+        metavar="DB_DIR",
+    )
+
+    build_all.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: one per available CPU)",
+        metavar="JOBS",
+    )
+
+    pb2json = subparsers.add_parser(
+        "pb2json", help="convert a built binary config to JSON"
+    )
+
+    pb2json.set_defaults(func=pb2json_command)
+
+    pb2json.add_argument(
+        "bin_file",
+        type=str,
+        help="path of the binary config file to convert",
+        metavar="BIN_FILE",
+    )
+
+    pb2json.add_argument(
+        "message_type",
+        type=str,
+        help="fully-qualified protobuf message type of the config",
+        metavar="MESSAGE_TYPE",
+    )
+
+    pb2json.add_argument(
+        "-m",
+        "--proto-module",
+        dest="proto_modules",
+        action="append",
+        default=[],
+        type=str,
+        help="Python module defining MESSAGE_TYPE (may be repeated)",
+        metavar="MODULE",
+    )
+
+    pb2json.add_argument(
+        "-o",
+        "--output",
+        dest="out_file",
+        type=str,
+        help="path to write the JSON to (default: stdout)",
+        metavar="OUT_FILE",
+    )
 
     query = subparsers.add_parser("query", help="query a config database")
 
@@ -132,6 +228,8 @@ def main(argv: list[str] | None = None) -> int:
         "ls", help="List the paths of all configs in a given directory"
     )
 
+    ls.set_defaults(func=ls_command)
+
     ls.add_argument(
         "dir",
         type=str,
@@ -150,6 +248,8 @@ def main(argv: list[str] | None = None) -> int:
         "rdeps", help="List the paths of all configs that depend on a given config"
     )
 
+    rdeps.set_defaults(func=rdeps_command)
+
     rdeps.add_argument(
         "config_file",
         type=str,
@@ -157,60 +257,121 @@ def main(argv: list[str] | None = None) -> int:
         metavar="CONFIG_FILE",
     )
 
-    args = parser.parse_args(argv)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _get_parser().parse_args(argv)
+    level = LOG_LEVELS[args.log_level]
+
+    _configure_logging(level)
+
+    return args.func(args) or 0
 
+
+def _configure_logging(level: int) -> None:
     logging.basicConfig(
         stream=sys.stderr,
-        level=LOG_LEVELS[args.log_level],
+        level=level,
         format="%(asctime)s [%(levelname)s] %(message)s",
         datefmt="%Y-%m-%dT%H:%M:%S%z",
     )
 
-    if args.command == "db":
-        if args.db_command == "create":
-            create_command(args)
-        if args.db_command == "restore":
-            restore_command(args)
-        if args.db_command == "backup":
-            backup_command(args)
-
-    if args.command == "build":
-        build_command(args)
 
-    if args.command == "query":
-        if args.subquery == "ls":
-            ls_command(args)
-        if args.subquery == "rdeps":
-            rdeps_command(args)
+def _check_protobuf_implementation() -> None:
+    from google.protobuf.internal import api_implementation
 
-    return 0
+    if api_implementation.Type() == "python":
+        logging.getLogger(__name__).warning(
+            "Using the pure-Python protobuf implementation; "
+            "serialization will be much slower than with upb"
+        )
 
 
 def create_command(args: argparse.Namespace):
-    db_dir = PosixPath(args.db_dir).resolve(strict=False)
-    DB.create(db_dir)
+    from .ConfigStore import ConfigStore
+
+    db_dir = resolve_path(args.db_dir, strict=False)
+    ConfigStore.create(db_dir)
 
 
 def restore_command(args: argparse.Namespace):
-    snapshot_file = PosixPath(args.snapshot_file).resolve(strict=True)
-    db_dir = PosixPath(args.db_dir).resolve(strict=False)
+    from .DB import DB
+
+    snapshot_file = resolve_path(args.snapshot_file, strict=True)
+    db_dir = resolve_path(args.db_dir, strict=False)
     DB.restore(snapshot_file, db_dir)
 
 
 def backup_command(args: argparse.Namespace):
-    db_dir = PosixPath(args.db_dir).resolve(strict=True)
-    snapshot_file = PosixPath(args.snapshot_file).resolve(strict=False)
+    from .DB import DB
+
+    db_dir = resolve_path(args.db_dir, strict=True)
+    snapshot_file = resolve_path(args.snapshot_file, strict=False)
     with DB.open("r", db_dir) as db:
         db.backup(snapshot_file)
 
 
 def build_command(args: argparse.Namespace):
-    config_file = PosixPath(args.config_file).resolve(strict=True)
-    out_dir = PosixPath(args.out_dir).resolve(strict=False)
-    db_dir = PosixPath(args.db_dir).resolve(strict=True) if args.db_dir else None
+    from .build import build_many
+
+    config_files = [resolve_path(f, strict=True) for f in args.config_files]
+    out_dir = resolve_path(args.out_dir, strict=False)
+    db_dir = resolve_path(args.db_dir, strict=True) if args.db_dir else None
     json: bool = args.json
 
-    build(config_file, out_dir, json, db_dir)
+    _check_protobuf_implementation()
+
+    if json:
+        logging.getLogger(__name__).warning(
+            "--json is deprecated; build binary output and convert it with pb2json"
+        )
+
+    build_many(config_files, out_dir, json, db_dir)
+
+
+def build_all_command(args: argparse.Namespace):
+    import glob
+    from functools import partial
+    from .build import build_all
+
+    config_files = [
+        resolve_path(f, strict=True)
+        for f in sorted(glob.glob(args.pattern, recursive=True))
+    ]
+    if not config_files:
+        raise FileNotFoundError(f"No config files match {args.pattern}")
+
+    out_dir = resolve_path(args.out_dir, strict=False)
+    db_dir = resolve_path(args.db_dir, strict=True) if args.db_dir else None
+
+    _check_protobuf_implementation()
+
+    level = logging.getLogger().getEffectiveLevel()
+    build_all(
+        config_files,
+        out_dir,
+        False,
+        db_dir,
+        max_workers=args.jobs,
+        initializer=partial(_configure_logging, level),
+    )
+
+
+def pb2json_command(args: argparse.Namespace):
+    from .pb2json import pb2json
+
+    _check_protobuf_implementation()
+
+    bin_file = resolve_path(args.bin_file, strict=True)
+    output = pb2json(bin_file, args.message_type, args.proto_modules)
+
+    if args.out_file:
+        out_file = resolve_path(args.out_file, strict=False)
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        out_file.write_text(output, encoding="utf-8")
+    else:
+        print(output)
 
 
 def ls_command(args: argparse.Namespace):
@@ -218,13 +379,14 @@ def ls_command(args: argparse.Namespace):
 
 
 def rdeps_command(args: argparse.Namespace):
-    db_dir = PosixPath(args.db_dir).resolve(strict=True)
-    pwd = PosixPath.cwd().resolve()
-    config_file = PosixPath(args.config_file).resolve(strict=False).relative_to(pwd)
+    from .DB import DB
+    from .ConfigStore import ConfigStore
 
-    with DB.open("r", db_dir) as db:
-        from .ConfigStore import ConfigStore
+    db_dir = resolve_path(args.db_dir, strict=True)
+    pwd = get_cwd()
+    config_file = resolve_path(args.config_file, strict=False).relative_to(pwd)
 
+    with DB.open("r", db_dir) as db:
         store = ConfigStore(db)
         for rdep in store.get_rdeps(config_file):
             print(rdep)
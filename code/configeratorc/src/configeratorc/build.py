@@ -1,22 +1,71 @@
+import importlib.abc
+import importlib.machinery
 import importlib.util
 import logging
-from pathlib import PosixPath
-import posixpath
+import os
+from pathlib import PosixPath, PurePosixPath
+import py_compile
 import sys
+import sysconfig
 from types import ModuleType
+from typing import Any
+from collections.abc import Callable, Iterable, Sequence
+from functools import partial
 import json
 from google.protobuf.json_format import MessageToJson
+from .paths import get_cwd
+
+
+_config_dirs_on_sys_path: set[str] = set()
+
+_ensured_dirs: set[str] = set()
+
+_install_prefixes: tuple[str, ...] = tuple(
+    {
+        os.path.realpath(p) + os.sep
+        for p in (
+            sys.prefix,
+            sys.exec_prefix,
+            sys.base_prefix,
+            sysconfig.get_path("purelib"),
+            sysconfig.get_path("platlib"),
+        )
+    }
+)
+
+
+def _prime_bytecode_cache(config_file: PosixPath) -> None:
+    if sys.dont_write_bytecode:
+        return
+
+    source = str(config_file)
+    cfile = importlib.util.cache_from_source(source)
+    if os.path.exists(cfile):
+        return
+
+    try:
+        py_compile.compile(
+            source,
+            cfile=cfile,
+            doraise=True,
+            invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+        )
+    except (OSError, py_compile.PyCompileError):
+        pass
 
 
 def _load_config(
     config_file: PosixPath,
 ) -> ModuleType:
-    dirname = config_file.parent
-    basename = config_file.stem
-    module_name = posixpath.splitext(basename)[0]
+    dirname = str(config_file.parent)
+    module_name = config_file.stem
 
-    if str(dirname) not in sys.path:
-        sys.path.insert(0, str(dirname))
+    if dirname not in _config_dirs_on_sys_path:
+        if dirname not in sys.path:
+            sys.path.insert(0, dirname)
+        _config_dirs_on_sys_path.add(dirname)
+
+    _prime_bytecode_cache(config_file)
 
     spec = importlib.util.spec_from_file_location(module_name, str(config_file))
     if spec is None or spec.loader is None:
@@ -28,65 +77,187 @@ def _load_config(
     return module
 
 
-def build(
+def _strip_pwd(abs_path: str, pwd_prefix: str) -> str:
+    if abs_path.startswith(pwd_prefix):
+        return abs_path[len(pwd_prefix) :]
+    return abs_path
+
+
+def _is_config_module(origin: str, pwd_prefix: str) -> bool:
+    return origin.startswith(pwd_prefix) and not origin.startswith(_install_prefixes)
+
+
+def _ensure_dir(path: PosixPath) -> None:
+    key = str(path)
+    if key not in _ensured_dirs:
+        path.mkdir(parents=True, exist_ok=True)
+        _ensured_dirs.add(key)
+
+
+def _write_file(path: PosixPath, data: bytes) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+
+
+class _ImportRecorder(importlib.abc.MetaPathFinder):
+    modules: list[tuple[str, str]]
+
+    def __init__(self) -> None:
+        self.modules = []
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Sequence[str] | None,
+        target: ModuleType | None = None,
+    ) -> importlib.machinery.ModuleSpec | None:
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is not None and spec.has_location and spec.origin is not None:
+            self.modules.append((fullname, os.path.realpath(spec.origin)))
+        return spec
+
+    def invalidate_caches(self) -> None:
+        importlib.machinery.PathFinder.invalidate_caches()
+
+    def find_distributions(self, *args: Any, **kwargs: Any) -> Iterable[Any]:
+        return importlib.machinery.PathFinder.find_distributions(*args, **kwargs)
+
+
+def _build_one(
     config_file: PosixPath,
     out_dir: PosixPath,
     write_json: bool,
-    db_dir: PosixPath | None,
-) -> None:
+) -> tuple[PosixPath, list[str]]:
     logger = logging.getLogger(__name__)
-    logger.info(f"Loading configuration from {config_file}")
-
-    pwd = PosixPath.cwd().resolve()
-    config_file = config_file.relative_to(pwd)
+    logger.info("Loading configuration from %s", config_file)
 
-    loaded_modules_before_build = set(sys.modules.keys())
+    pwd_prefix = str(get_cwd()) + os.sep
+    config_path = str(config_file)
+    if not config_path.startswith(pwd_prefix):
+        raise ValueError(f"{config_file} is not inside {pwd_prefix[:-1]}")
+    config_file = PosixPath(_strip_pwd(config_path, pwd_prefix))
 
-    config_module = _load_config(config_file)
+    recorder = _ImportRecorder()
+    sys.meta_path[sys.meta_path.index(importlib.machinery.PathFinder)] = recorder
+    try:
+        config_module = _load_config(config_file)
 
-    if not hasattr(config_module, "export_config"):
-        raise AttributeError(
-            f"The configuration file {config_file} does not define 'export_config' function."
-        )
+        if not hasattr(config_module, "export_config"):
+            raise AttributeError(
+                f"The configuration file {config_file} does not define 'export_config' function."
+            )
 
-    export_config_func = getattr(config_module, "export_config")
-    config = export_config_func()
+        export_config_func = getattr(config_module, "export_config")
+        config = export_config_func()
+    finally:
+        sys.meta_path[sys.meta_path.index(recorder)] = importlib.machinery.PathFinder
+        # Specs that were only probed (importlib.util.find_spec) or whose module
+        # failed to execute never make it into sys.modules.
+        recorder.modules = [
+            (name, origin) for name, origin in recorder.modules if name in sys.modules
+        ]
+        # Unload the config repo's modules so the next config in this process
+        # re-imports, and so records, the ones it shares with this one.
+        for name, origin in recorder.modules:
+            if _is_config_module(origin, pwd_prefix):
+                sys.modules.pop(name, None)
 
     if write_json:
-        output = MessageToJson(config)
+        output = MessageToJson(config).encode()
         out_file = out_dir / config_file.with_suffix(".json")
-        out_file.parent.mkdir(parents=True, exist_ok=True)
-        with out_file.open("w") as f:
-            f.write(output)
-        logger.info(f"Wrote JSON configuration to {out_file}")
+        _ensure_dir(out_file.parent)
+        _write_file(out_file, output)
+        logger.info("Wrote JSON configuration to %s", out_file)
     else:
         output = config.SerializeToString()
         out_file = out_dir / config_file.with_suffix(".bin")
-        out_file.parent.mkdir(parents=True, exist_ok=True)
-        with out_file.open("wb") as f:
-            f.write(output)
-        logger.info(f"Wrote binary configuration to {out_file}")
-
-    if db_dir:
-        from .DB import DB
-        from .ConfigStore import ConfigStore
-
-        loaded_module_paths_during_build = list(
-            {
-                PosixPath(module.__file__).resolve().relative_to(pwd)
-                for name, module in sys.modules.items()
-                if name not in loaded_modules_before_build
-                and module.__file__ is not None
-                and module.__file__.startswith(str(pwd))
-            }
-        )
+        _ensure_dir(out_file.parent)
+        _write_file(out_file, output)
+        logger.info("Wrote binary configuration to %s", out_file)
+
+    loaded_module_paths_during_build: list[str] = []
+    seen: set[str] = set()
+    for _, origin in recorder.modules:
+        if not _is_config_module(origin, pwd_prefix) or origin in seen:
+            continue
+        seen.add(origin)
+        loaded_module_paths_during_build.append(_strip_pwd(origin, pwd_prefix))
 
+    if logger.isEnabledFor(logging.INFO):
         logger.info(
-            f"Modules loaded during execution: {json.dumps([str(path) for path in loaded_module_paths_during_build], indent=2)}"
+            "Modules loaded during execution: %s",
+            json.dumps(loaded_module_paths_during_build, indent=2),
         )
 
-        logger.info(f"Recording reverse dependencies in DB at {db_dir}")
-        with DB.open("rw", db_dir) as db:
-            store = ConfigStore(db)
-            for path in loaded_module_paths_during_build:
-                store.put_rdep(path, config_file)
+    return config_file, loaded_module_paths_during_build
+
+
+def _record_rdeps(
+    results: Iterable[tuple[PosixPath, list[str]]],
+    db_dir: PosixPath | None,
+    bulk: bool,
+) -> None:
+    if not db_dir:
+        for _ in results:
+            pass
+        return
+
+    from .DB import DB
+    from .ConfigStore import ConfigStore
+
+    logging.getLogger(__name__).info(
+        "Recording reverse dependencies in DB at %s", db_dir
+    )
+    with DB.open("rw", db_dir) as db:
+        store = ConfigStore(db)
+        for config_file, module_paths in results:
+            store.put_rdeps(
+                map(PurePosixPath, module_paths), config_file, disable_wal=bulk
+            )
+        if bulk:
+            db.flush()
+
+
+def build_many(
+    config_files: Iterable[PosixPath],
+    out_dir: PosixPath,
+    write_json: bool,
+    db_dir: PosixPath | None,
+) -> None:
+    config_files = list(config_files)
+    build_one = partial(_build_one, out_dir=out_dir, write_json=write_json)
+    _record_rdeps(map(build_one, config_files), db_dir, len(config_files) > 1)
+
+
+def build_all(
+    config_files: Iterable[PosixPath],
+    out_dir: PosixPath,
+    write_json: bool,
+    db_dir: PosixPath | None,
+    *,
+    max_workers: int | None = None,
+    initializer: Callable[[], object] | None = None,
+) -> None:
+    from concurrent.futures import ProcessPoolExecutor
+
+    build_one = partial(_build_one, out_dir=out_dir, write_json=write_json)
+    with ProcessPoolExecutor(max_workers, initializer=initializer) as executor:
+        try:
+            _record_rdeps(executor.map(build_one, config_files), db_dir, True)
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def build(
+    config_file: PosixPath,
+    out_dir: PosixPath,
+    write_json: bool,
+    db_dir: PosixPath | None,
+) -> None:
+    build_many((config_file,), out_dir, write_json, db_dir)
@@ -0,0 +1,12 @@
+from functools import lru_cache
+from pathlib import PosixPath
+
+
+@lru_cache(maxsize=256)
+def resolve_path(path: str, strict: bool = False) -> PosixPath:
+    return PosixPath(path).resolve(strict=strict)
+
+
+@lru_cache(maxsize=1)
+def get_cwd() -> PosixPath:
+    return PosixPath.cwd().resolve()
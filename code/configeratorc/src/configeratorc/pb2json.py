@@ -0,0 +1,38 @@
+import importlib
+import logging
+import os
+from pathlib import PosixPath
+import sys
+from google.protobuf import descriptor_pool, message_factory
+from google.protobuf.json_format import MessageToJson
+
+
+def pb2json(
+    bin_file: PosixPath,
+    message_type: str,
+    proto_modules: list[str],
+) -> str:
+    logger = logging.getLogger(__name__)
+
+    cwd = os.getcwd()
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+
+    for module_name in proto_modules:
+        logger.debug("Importing %s", module_name)
+        importlib.import_module(module_name)
+
+    try:
+        descriptor = descriptor_pool.Default().FindMessageTypeByName(message_type)
+    except KeyError:
+        raise LookupError(
+            f"Unknown message type {message_type!r}; "
+            "import the module that defines it with --proto-module"
+        ) from None
+
+    message = message_factory.GetMessageClass(descriptor)()
+
+    logger.info("Reading binary configuration from %s", bin_file)
+    message.ParseFromString(bin_file.read_bytes())
+
+    return MessageToJson(message)
@@ -5,12 +5,18 @@
 #include <memory>
 #include <new>
 #include <string>
+#include <string_view>
+#include <unordered_set>
+#include <vector>
 #include <cerrno>
 
 #include <rocksdb/db.h>
+#include <rocksdb/filter_policy.h>
+#include <rocksdb/merge_operator.h>
 #include <rocksdb/options.h>
 #include <rocksdb/slice.h>
 #include <rocksdb/status.h>
+#include <rocksdb/table.h>
 #include <rocksdb/write_batch.h>
 #include <rocksdb/utilities/backup_engine.h>
 
@@ -18,16 +24,205 @@ struct rocksdb_handle
 {
     std::unique_ptr<rocksdb::DB> db;
     rocksdb::WriteOptions write_options;
+    // Used by batched writes that opt out of the WAL. Those writes only become
+    // durable once their memtables are flushed.
+    rocksdb::WriteOptions no_wal_write_options;
     rocksdb::ReadOptions read_options;
 };
 
 struct rocksdb_prefix_iterator
 {
+    // The iterator's ReadOptions only point at the upper bound, so these are
+    // declared ahead of `iterator` to make sure they outlive it.
+    std::string upper_bound;
+    rocksdb::Slice upper_bound_slice;
     std::unique_ptr<rocksdb::Iterator> iterator;
     std::string prefix;
     bool started;
+    bool exhausted;
+    // Owns the keys handed out by the last batched advance. Iterator key
+    // slices are invalidated by Next(), so batched keys are copied here.
+    std::string batch;
+    std::vector<size_t> batch_offsets;
 };
 
+namespace
+{
+    template <typename F>
+    void for_each_item(std::string_view items, F &&f)
+    {
+        while (!items.empty())
+        {
+            const size_t end = items.find('\0');
+            const std::string_view item = items.substr(0, end);
+            if (!item.empty())
+            {
+                f(item);
+            }
+            if (end == std::string_view::npos)
+            {
+                break;
+            }
+            items.remove_prefix(end + 1);
+        }
+    }
+
+    // Treats values as NUL-delimited sets of items. Merging an operand appends
+    // each of its items that the existing value does not already contain, so
+    // re-recording an item is idempotent.
+    class NulDelimitedSetUnionOperator : public rocksdb::AssociativeMergeOperator
+    {
+    public:
+        bool Merge(
+            const rocksdb::Slice & /*key*/,
+            const rocksdb::Slice *existing_value,
+            const rocksdb::Slice &value,
+            std::string *new_value,
+            rocksdb::Logger * /*logger*/) const override
+        {
+            if (!existing_value || existing_value->empty())
+            {
+                new_value->assign(value.data(), value.size());
+                return true;
+            }
+
+            const std::string_view existing(existing_value->data(), existing_value->size());
+            std::unordered_set<std::string_view> seen;
+            for_each_item(existing, [&](std::string_view item)
+                          { seen.insert(item); });
+
+            new_value->assign(existing.data(), existing.size());
+            for_each_item(
+                std::string_view(value.data(), value.size()),
+                [&](std::string_view item)
+                {
+                    if (seen.insert(item).second)
+                    {
+                        new_value->push_back('\0');
+                        new_value->append(item.data(), item.size());
+                    }
+                });
+
+            return true;
+        }
+
+        const char *Name() const override
+        {
+            return "NulDelimitedSetUnionOperator";
+        }
+    };
+
+    rocksdb::Options make_options(bool create_if_missing)
+    {
+        rocksdb::BlockBasedTableOptions table_options;
+        table_options.filter_policy.reset(rocksdb::NewBloomFilterPolicy(10, false));
+
+        rocksdb::Options options;
+        options.create_if_missing = create_if_missing;
+        options.compression = rocksdb::kNoCompression;
+        options.bottommost_compression = rocksdb::kNoCompression;
+        options.table_factory.reset(rocksdb::NewBlockBasedTableFactory(table_options));
+        options.merge_operator = std::make_shared<NulDelimitedSetUnionOperator>();
+
+        return options;
+    }
+
+    // Computes the smallest key greater than every key starting with `prefix`.
+    // Returns false if there is no such key (empty or all-0xFF prefix).
+    bool prefix_upper_bound(const std::string &prefix, std::string *upper_bound)
+    {
+        std::string bound = prefix;
+        while (!bound.empty() && static_cast<unsigned char>(bound.back()) == 0xFF)
+        {
+            bound.pop_back();
+        }
+
+        if (bound.empty())
+        {
+            return false;
+        }
+
+        bound.back() = static_cast<char>(static_cast<unsigned char>(bound.back()) + 1);
+        *upper_bound = std::move(bound);
+
+        return true;
+    }
+
+    int write_batch(
+        const char *function,
+        rocksdb_handle *handle,
+        const char *const *keys,
+        const size_t *key_lens,
+        const char *const *values,
+        const size_t *value_lens,
+        size_t count,
+        int disable_wal,
+        char **error)
+    {
+        if (error)
+        {
+            *error = nullptr;
+        }
+
+        if (!handle ||
+            (count > 0 && (!keys || !key_lens || !values || !value_lens)))
+        {
+            if (error)
+            {
+                *error = strdup((std::string(function) + ": invalid argument").c_str());
+            }
+            errno = EINVAL;
+            return -1;
+        }
+
+        rocksdb::WriteBatch batch;
+
+        for (size_t i = 0; i < count; ++i)
+        {
+            if ((key_lens[i] > 0 && !keys[i]) ||
+                (value_lens[i] > 0 && !values[i]))
+            {
+                if (error)
+                {
+                    *error = strdup((std::string(function) + ": invalid argument").c_str());
+                }
+                errno = EINVAL;
+                return -1;
+            }
+
+            rocksdb::Slice key_slice(keys[i], key_lens[i]);
+            rocksdb::Slice value_slice(values[i], value_lens[i]);
+            rocksdb::Status status = batch.Merge(key_slice, value_slice);
+
+            if (!status.ok())
+            {
+                if (error)
+                {
+                    *error = strdup(status.ToString().c_str());
+                }
+                errno = EIO;
+                return -1;
+            }
+        }
+
+        rocksdb::Status status = handle->db->Write(
+            disable_wal != 0 ? handle->no_wal_write_options : handle->write_options,
+            &batch);
+
+        if (!status.ok())
+        {
+            if (error)
+            {
+                *error = strdup(status.ToString().c_str());
+            }
+            errno = EIO;
+            return -1;
+        }
+
+        return 0;
+    }
+} // namespace
+
 extern "C"
 {
     rocksdb_handle *rocksdb_open(
@@ -50,10 +245,7 @@ extern "C"
             return nullptr;
         }
 
-        rocksdb::Options options;
-        options.create_if_missing = (create_if_missing != 0);
-        options.compression = rocksdb::kNoCompression;
-        options.bottommost_compression = rocksdb::kNoCompression;
+        rocksdb::Options options = make_options(create_if_missing != 0);
 
         rocksdb::DB *db = nullptr;
         rocksdb::Status status = rocksdb::DB::Open(options, path, &db);
@@ -82,6 +274,8 @@ extern "C"
 
         handle->db.reset(db);
         handle->write_options = rocksdb::WriteOptions();
+        handle->no_wal_write_options = rocksdb::WriteOptions();
+        handle->no_wal_write_options.disableWAL = true;
         handle->read_options = rocksdb::ReadOptions();
 
         return handle.release();
@@ -106,10 +300,7 @@ extern "C"
             return nullptr;
         }
 
-        rocksdb::Options options;
-        options.create_if_missing = false;
-        options.compression = rocksdb::kNoCompression;
-        options.bottommost_compression = rocksdb::kNoCompression;
+        rocksdb::Options options = make_options(false);
 
         rocksdb::DB *db = nullptr;
         rocksdb::Status status = rocksdb::DB::OpenForReadOnly(options, path, &db);
@@ -137,6 +328,8 @@ extern "C"
 
         handle->db.reset(db);
         handle->write_options = rocksdb::WriteOptions();
+        handle->no_wal_write_options = rocksdb::WriteOptions();
+        handle->no_wal_write_options.disableWAL = true;
         handle->read_options = rocksdb::ReadOptions();
 
         return handle.release();
@@ -366,10 +559,15 @@ extern "C"
         *value = nullptr;
         *value_len = 0;
 
+        // A PinnableSlice lets RocksDB hand back the value in place (pinned in
+        // the block cache or memtable) instead of first copying it into a
+        // std::string, so the value is copied exactly once, into the caller's
+        // buffer.
         rocksdb::Slice key_slice(key, key_len);
-        std::string result;
+        rocksdb::PinnableSlice result;
         rocksdb::Status status = handle->db->Get(
             handle->read_options,
+            handle->db->DefaultColumnFamily(),
             key_slice,
             &result);
 
@@ -412,6 +610,73 @@ extern "C"
         return 0;
     }
 
+    int rocksdb_merge(
+        rocksdb_handle *handle,
+        const char *key,
+        size_t key_len,
+        const char *value,
+        size_t value_len,
+        char **error)
+    {
+        if (error)
+        {
+            *error = nullptr;
+        }
+
+        if (!handle ||
+            (key_len > 0 && !key) ||
+            (value_len > 0 && !value))
+        {
+            if (error)
+            {
+                *error = strdup("rocksdb_merge: invalid argument");
+            }
+            errno = EINVAL;
+            return -1;
+        }
+
+        rocksdb::Slice key_slice(key, key_len);
+        rocksdb::Slice value_slice(value, value_len);
+        rocksdb::Status status = handle->db->Merge(
+            handle->write_options,
+            key_slice,
+            value_slice);
+
+        if (!status.ok())
+        {
+            if (error)
+            {
+                *error = strdup(status.ToString().c_str());
+            }
+            errno = EIO;
+            return -1;
+        }
+
+        return 0;
+    }
+
+    int rocksdb_merge_batch(
+        rocksdb_handle *handle,
+        const char *const *keys,
+        const size_t *key_lens,
+        const char *const *values,
+        const size_t *value_lens,
+        size_t count,
+        int disable_wal,
+        char **error)
+    {
+        return write_batch(
+            "rocksdb_merge_batch",
+            handle,
+            keys,
+            key_lens,
+            values,
+            value_lens,
+            count,
+            disable_wal,
+            error);
+    }
+
     int rocksdb_delete(
         rocksdb_handle *handle,
         const char *key,
@@ -450,6 +715,43 @@ extern "C"
         return 0;
     }
 
+    int rocksdb_flush(
+        rocksdb_handle *handle,
+        char **error)
+    {
+        if (error)
+        {
+            *error = nullptr;
+        }
+
+        if (!handle)
+        {
+            if (error)
+            {
+                *error = strdup("rocksdb_flush: handle is null");
+            }
+            errno = EINVAL;
+            return -1;
+        }
+
+        rocksdb::FlushOptions flush_options;
+        flush_options.wait = true;
+
+        rocksdb::Status status = handle->db->Flush(flush_options);
+
+        if (!status.ok())
+        {
+            if (error)
+            {
+                *error = strdup(status.ToString().c_str());
+            }
+            errno = EIO;
+            return -1;
+        }
+
+        return 0;
+    }
+
     void rocksdb_free(void *p)
     {
         std::free(p);
@@ -476,17 +778,6 @@ extern "C"
             return nullptr;
         }
 
-        std::unique_ptr<rocksdb::Iterator> iterator(handle->db->NewIterator(handle->read_options));
-        if (!iterator)
-        {
-            if (error)
-            {
-                *error = strdup("rocksdb_create_prefix_iterator: failed to create iterator");
-            }
-            errno = EIO;
-            return nullptr;
-        }
-
         auto prefix_iterator = std::make_unique<rocksdb_prefix_iterator>();
         if (!prefix_iterator)
         {
@@ -498,13 +789,34 @@ extern "C"
             return nullptr;
         }
 
-        prefix_iterator->iterator = std::move(iterator);
         prefix_iterator->prefix.clear();
         if (prefix_len > 0)
         {
             prefix_iterator->prefix.assign(prefix, prefix_len);
         }
+
+        // Bound the scan to the prefix so that RocksDB stops at the end of the
+        // range instead of reading (and skipping tombstones) past it.
+        rocksdb::ReadOptions read_options = handle->read_options;
+        if (prefix_upper_bound(prefix_iterator->prefix, &prefix_iterator->upper_bound))
+        {
+            prefix_iterator->upper_bound_slice = rocksdb::Slice(prefix_iterator->upper_bound);
+            read_options.iterate_upper_bound = &prefix_iterator->upper_bound_slice;
+        }
+
+        prefix_iterator->iterator.reset(handle->db->NewIterator(read_options));
+        if (!prefix_iterator->iterator)
+        {
+            if (error)
+            {
+                *error = strdup("rocksdb_create_prefix_iterator: failed to create iterator");
+            }
+            errno = EIO;
+            return nullptr;
+        }
+
         prefix_iterator->started = false;
+        prefix_iterator->exhausted = false;
 
         return prefix_iterator.release();
     }
@@ -575,4 +887,100 @@ extern "C"
 
         return 0;
     }
+
+    int rocksdb_advance_prefix_iterator_batch(
+        rocksdb_prefix_iterator *prefix_iterator,
+        size_t max_keys,
+        const char **key_data,
+        size_t *key_lens,
+        size_t *key_count,
+        char **error)
+    {
+        if (error)
+        {
+            *error = nullptr;
+        }
+
+        if (!prefix_iterator || max_keys == 0 || !key_data || !key_lens || !key_count)
+        {
+            if (error)
+            {
+                *error = strdup("rocksdb_advance_prefix_iterator_batch: invalid argument");
+            }
+            errno = EINVAL;
+            return -1;
+        }
+
+        *key_count = 0;
+
+        if (prefix_iterator->exhausted)
+        {
+            return 1;
+        }
+
+        rocksdb::Iterator *iterator = prefix_iterator->iterator.get();
+        std::string &batch = prefix_iterator->batch;
+        std::vector<size_t> &offsets = prefix_iterator->batch_offsets;
+
+        batch.clear();
+        offsets.clear();
+
+        size_t count = 0;
+        while (count < max_keys)
+        {
+            if (!prefix_iterator->started)
+            {
+                iterator->Seek(prefix_iterator->prefix);
+                prefix_iterator->started = true;
+            }
+            else
+            {
+                iterator->Next();
+            }
+
+            if (!iterator->status().ok())
+            {
+                if (error)
+                {
+                    *error = strdup(iterator->status().ToString().c_str());
+                }
+                errno = EIO;
+                return -1;
+            }
+
+            if (!iterator->Valid())
+            {
+                prefix_iterator->exhausted = true;
+                break;
+            }
+
+            rocksdb::Slice key_slice = iterator->key();
+
+            if (!key_slice.starts_with(prefix_iterator->prefix))
+            {
+                prefix_iterator->exhausted = true;
+                break;
+            }
+
+            offsets.push_back(batch.size());
+            batch.append(key_slice.data(), key_slice.size());
+            key_lens[count] = key_slice.size();
+            ++count;
+        }
+
+        if (count == 0)
+        {
+            return 1;
+        }
+
+        // Only take pointers once the batch buffer has stopped growing.
+        for (size_t i = 0; i < count; ++i)
+        {
+            key_data[i] = batch.data() + offsets[i];
+        }
+
+        *key_count = count;
+
+        return 0;
+    }
 } // extern "C"